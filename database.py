@@ -57,20 +57,22 @@ class Database:
         """Initialize database connection and schema.
 
         Args:
-            db_path: Path to the SQLite database file
+            db_path: Path to the SQLite database file or a "file:" URI
         """
         self.db_path = db_path
         # Register datetime adapter and converter
         sqlite3.register_adapter(datetime, adapt_datetime)
         sqlite3.register_converter("TIMESTAMP", convert_datetime)
-        # Connect with type detection
-        def get_connection(self):
-            """Create a new SQLite connection for each thread-safe operation."""
-            conn = sqlite3.connect(
-                self.db_path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-            )
-            conn.row_factory = sqlite3.Row  # Enable named column access
-            return conn
+        # Connect with type detection. uri=True lets callers pass SQLite URIs
+        # such as "file:name?mode=memory&cache=shared"; the connection is
+        # shared by the server's client threads.
+        self.conn = sqlite3.connect(
+            self.db_path,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+            uri=True,
+            check_same_thread=False,
+        )
+        self.conn.row_factory = sqlite3.Row  # Enable named column access
 
         self.init_db()
 
@@ -150,11 +152,13 @@ class Database:
             cursor = self.conn.cursor()
             # Hash the password with bcrypt
             password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-            cursor.execute(
-                "INSERT INTO users (username, password_hash) VALUES (?, ?)",
-                (username, password_hash),
-            )
-            self.conn.commit()
+            # Commits on success and rolls back on error, so a rejected
+            # insert does not leave a shared-cache database locked
+            with self.conn:
+                cursor.execute(
+                    "INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                    (username, password_hash),
+                )
             return True
         except sqlite3.IntegrityError:
             return False  # Username already exists
@@ -205,24 +209,24 @@ class Database:
             RuntimeError: If message ID generation fails
         """
         cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO messages (
-                sender, recipient, content, timestamp, 
-                message_type, read_status, delivered
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-            (
-                message.username,
-                message.recipients[0] if message.recipients else None,
-                message.content,
-                message.timestamp,
-                message.message_type,
-                False,
-                False,
-            ),
-        )
-        self.conn.commit()
+        with self.conn:
+            cursor.execute(
+                """
+                INSERT INTO messages (
+                    sender, recipient, content, timestamp, 
+                    message_type, read_status, delivered
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    message.username,
+                    message.recipients[0] if message.recipients else None,
+                    message.content,
+                    message.timestamp,
+                    message.message_type,
+                    False,
+                    False,
+                ),
+            )
         if cursor.lastrowid is None:
             raise RuntimeError("Failed to generate message ID")
         return cursor.lastrowid
@@ -275,15 +279,15 @@ class Database:
             message_id: ID of the message to mark as delivered
         """
         cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            UPDATE messages
-            SET delivered = TRUE
-            WHERE id = ?
-        """,
-            (message_id,),
-        )
-        self.conn.commit()
+        with self.conn:
+            cursor.execute(
+                """
+                UPDATE messages
+                SET delivered = TRUE
+                WHERE id = ?
+            """,
+                (message_id,),
+            )
 
     def mark_read(self, message_ids: List[int], username: str) -> None:
         """Mark specific messages as read for a user.
@@ -293,17 +297,17 @@ class Database:
             username: Username of the message recipient
         """
         cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            UPDATE messages 
-            SET read_status = TRUE 
-            WHERE id IN ({}) AND recipient = ?
-            """.format(
-                ",".join("?" * len(message_ids))
-            ),
-            (*message_ids, username),
-        )
-        self.conn.commit()
+        with self.conn:
+            cursor.execute(
+                """
+                UPDATE messages 
+                SET read_status = TRUE 
+                WHERE id IN ({}) AND recipient = ?
+                """.format(
+                    ",".join("?" * len(message_ids))
+                ),
+                (*message_ids, username),
+            )
 
     def mark_read_from_user(self, recipient: str, sender: str) -> None:
         """Mark all messages from a specific user as read.
@@ -313,15 +317,15 @@ class Database:
             sender: Username of the message sender
         """
         cursor = self.conn.cursor()
-        cursor.execute(
-            """
-            UPDATE messages 
-            SET read_status = TRUE 
-            WHERE sender = ? AND recipient = ? AND read_status = FALSE
-            """,
-            (sender, recipient),
-        )
-        self.conn.commit()
+        with self.conn:
+            cursor.execute(
+                """
+                UPDATE messages 
+                SET read_status = TRUE 
+                WHERE sender = ? AND recipient = ? AND read_status = FALSE
+                """,
+                (sender, recipient),
+            )
 
     def get_unread_count(self, recipient: str) -> int:
         """Get count of unread messages for a recipient.
@@ -376,20 +380,20 @@ class Database:
         )
         deleted_info = cursor.fetchall()
 
-        # Then delete the messages
-        cursor.execute(
-            """
-            DELETE FROM messages 
-            WHERE id IN ({}) AND (
-                (sender = ? AND recipient = ?) OR
-                (sender = ? AND recipient = ?)
+        with self.conn:
+            # Then delete the messages
+            cursor.execute(
+                """
+                DELETE FROM messages 
+                WHERE id IN ({}) AND (
+                    (sender = ? AND recipient = ?) OR
+                    (sender = ? AND recipient = ?)
+                )
+                """.format(
+                    ",".join("?" * len(message_ids))
+                ),
+                (*message_ids, username, recipient, recipient, username),
             )
-            """.format(
-                ",".join("?" * len(message_ids))
-            ),
-            (*message_ids, username, recipient, recipient, username),
-        )
-        self.conn.commit()
         return cursor.rowcount, deleted_info
 
     def get_all_users(self) -> List[str]:
@@ -460,23 +464,23 @@ class Database:
         """
         try:
             cursor = self.conn.cursor()
-            # Delete all messages where user is sender or recipient
-            cursor.execute(
-                """
-                DELETE FROM messages 
-                WHERE sender = ? OR recipient = ?
-                """,
-                (username, username),
-            )
-            # Delete the user
-            cursor.execute(
-                """
-                DELETE FROM users 
-                WHERE username = ?
-                """,
-                (username,),
-            )
-            self.conn.commit()
+            with self.conn:
+                # Delete all messages where user is sender or recipient
+                cursor.execute(
+                    """
+                    DELETE FROM messages 
+                    WHERE sender = ? OR recipient = ?
+                    """,
+                    (username, username),
+                )
+                # Delete the user
+                cursor.execute(
+                    """
+                    DELETE FROM users 
+                    WHERE username = ?
+                    """,
+                    (username,),
+                )
             # Return True only if a user was actually deleted
             return cursor.rowcount > 0
         except Exception as e:
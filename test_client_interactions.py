@@ -10,11 +10,18 @@ from schemas import ChatMessage, MessageType, SystemMessage, Status, ServerRespo
 from protocol import ProtocolFactory
 import os
 
+# Each pytest-xdist worker gets its own port and in-memory database. The port
+# range is separate from test_server.py so both files can run side by side.
+WORKER_ID = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+HOST = "localhost"
+PORT = 8100 + int(WORKER_ID[2:] or 0)
+TEST_DB_PATH = f"file:clienttest_{WORKER_ID}?mode=memory&cache=shared"
+
 
 @pytest.fixture(autouse=True)
 def clean_database():
     """Clean up the database before each test"""
-    db = Database("file::memory:?cache=shared")
+    db = Database(TEST_DB_PATH)
     db.conn.execute("DELETE FROM users")
     db.conn.execute("DELETE FROM messages")
     db.conn.commit()
@@ -22,16 +29,12 @@ def clean_database():
     db.conn.execute("DELETE FROM users")
     db.conn.execute("DELETE FROM messages")
     db.conn.commit()
-    try:
-        os.remove("file::memory:?cache=shared")
-    except OSError:
-        pass
 
 
 @pytest.fixture
 def test_server(clean_database):
     """Create a test server instance"""
-    server = ChatServer(db_path="file::memory:?cache=shared")
+    server = ChatServer(host=HOST, port=PORT, db_path=TEST_DB_PATH)
     server_thread = threading.Thread(target=server.start)
     server_thread.daemon = True
     server_thread.start()
@@ -53,7 +56,7 @@ class TestClientInteractions:
     def create_client_socket(self):
         """Helper to create and connect a client socket"""
         client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client.connect(("localhost", 8000))
+        client.connect((HOST, PORT))
         client.settimeout(1.0)
         return client
 
@@ -98,9 +101,9 @@ class TestClientInteractions:
         # Process login responses
         buffer = b""
         login_success = False
-        start_time = time.time()
+        deadline = time.monotonic() + 1.0
 
-        while not login_success and time.time() - start_time < 1.0:
+        while not login_success and time.monotonic() < deadline:
             try:
                 response_data = client.recv(1024)
                 if not response_data:
@@ -143,8 +146,8 @@ class TestClientInteractions:
     def receive_message(self, client, protocol, timeout=1.0):
         """Helper to receive and process a message"""
         buffer = b""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
             try:
                 response_data = client.recv(1024)
                 if not response_data:
@@ -168,8 +171,8 @@ class TestClientInteractions:
 
     def consume_notifications(self, client, protocol, timeout=0.2):
         """Helper to consume notifications until timeout"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
             try:
                 response = self.receive_message(client, protocol, timeout=0.1)
                 if not response or not response.data:
@@ -479,9 +482,9 @@ class TestClientInteractions:
             received_messages = []
 
             # Try to receive messages with timeout
-            start_time = time.time()
+            deadline = time.monotonic() + 5  # 5 second timeout
             while len(received_messages) < len(expected_messages):
-                if time.time() - start_time > 5:  # 5 second timeout
+                if time.monotonic() > deadline:
                     break
                 try:
                     response = self.receive_message(bob, protocol)
@@ -631,11 +634,11 @@ class TestClientInteractions:
                         print(f"Error sending message from user{i}: {e}")
 
             # Collect messages with increased timeout
-            start_time = time.time()
             expected_messages = num_users * num_messages  # Each user sends num_messages
             collection_timeout = 5
+            deadline = time.monotonic() + collection_timeout
 
-            while time.time() - start_time < collection_timeout:
+            while time.monotonic() < deadline:
                 all_received = True
                 for i, client in enumerate(clients):
                     if len(messages_received[i]) < expected_messages:
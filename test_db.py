@@ -55,6 +55,21 @@ def test_user_creation_and_verification(in_memory_db):
     assert in_memory_db.create_user(username, "anotherpass") == False
 
 
+def test_rejected_user_releases_lock():
+    """Test a rejected duplicate user does not leave the table locked"""
+    uri = "file:locktest?mode=memory&cache=shared"
+    db = Database(uri)
+    other = Database(uri)
+
+    assert db.create_user("testuser", "testpass") == True
+    assert db.create_user("testuser", "testpass") == False
+
+    # Another connection to the same shared-cache database can still write
+    other.conn.execute("DELETE FROM users")
+    other.conn.commit()
+    assert db.user_exists("testuser") == False
+
+
 def test_message_operations(in_memory_db):
     """Test message creation, retrieval, and status updates"""
     # Create test users
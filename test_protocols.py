@@ -1,6 +1,6 @@
 import unittest
 from datetime import datetime
-from protocol import JSONProtocol, CustomWireProtocol, Protocol
+from protocol import JSONProtocol, CustomWireProtocol, ORJSONProtocol, Protocol
 from schemas import ChatMessage, ServerResponse, MessageType, Status
 import random
 import string
@@ -12,6 +12,11 @@ import threading
 import time
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class BaseProtocolTest:
     """Base test class defining the test interface that both protocol implementations must satisfy"""
@@ -75,6 +80,36 @@ class BaseProtocolTest:
         self.assertEqual(deserialized.message, original_response.message)
         self.assertEqual(deserialized.data.content, original_response.data.content)
 
+    def test_peek_content(self):
+        """Test reading only the embedded content from a server response"""
+        chat_msg = ChatMessage(
+            username="system",
+            content="ユーザー joined",
+            message_type=MessageType.JOIN,
+            recipients=["user1"],
+            timestamp=datetime.now(),
+        )
+        response = ServerResponse(
+            status=Status.SUCCESS,
+            message="Operation successful",
+            unread_count=3,
+            data=chat_msg,
+        )
+
+        serialized = self.protocol.serialize_response(response)
+        self.assertEqual(
+            self.protocol.peek_content(serialized), chat_msg.content.encode("utf-8")
+        )
+        # Received frames are often bytearray slices
+        self.assertEqual(
+            self.protocol.peek_content(bytearray(serialized)),
+            chat_msg.content.encode("utf-8"),
+        )
+
+        # No embedded message means no content
+        empty = self.protocol.serialize_response(ServerResponse(message="ok"))
+        self.assertIsNone(self.protocol.peek_content(empty))
+
     def test_message_framing(self):
         """Test message framing and extraction"""
         msg1 = ChatMessage(
@@ -110,6 +145,113 @@ class BaseProtocolTest:
         # Buffer should be empty now
         self.assertEqual(len(remaining), 0)
 
+    def test_extract_message_from(self):
+        """Test extracting messages from a window without copying the rest"""
+        frames = [
+            self.protocol.to_wire(
+                ChatMessage(
+                    username="user1",
+                    content=f"Windowed message {i}",
+                    message_type=MessageType.CHAT,
+                    timestamp=datetime.now(),
+                )
+            )
+            for i in range(2)
+        ]
+        # Leading junk is outside the window and must be ignored
+        buffer = bytearray(b"junk" + frames[0] + frames[1])
+        start, end = 4, len(buffer)
+
+        for i, frame in enumerate(frames):
+            extracted, consumed = self.protocol.extract_message_from(buffer, start, end)
+            self.assertEqual(consumed, len(frame))
+            self.assertEqual(
+                self.protocol.deserialize_message(extracted).content,
+                f"Windowed message {i}",
+            )
+            start += consumed
+        self.assertEqual(start, end)
+
+        # A partial frame consumes nothing
+        extracted, consumed = self.protocol.extract_message_from(
+            frames[0], 0, len(frames[0]) - 1
+        )
+        self.assertIsNone(extracted)
+        self.assertEqual(consumed, 0)
+
+    def test_framer(self):
+        """Test the framer returns frames fed in arbitrary chunks, in order"""
+        frames = [
+            self.protocol.to_wire(
+                ChatMessage(
+                    username="user1",
+                    content=f"Framed message {i}",
+                    message_type=MessageType.CHAT,
+                    timestamp=datetime.now(),
+                )
+            )
+            for i in range(3)
+        ]
+        stream = b"".join(frames)
+
+        for chunk_size in (1, 7, len(stream)):
+            framer = self.protocol.framer()
+            received = []
+            for i in range(0, len(stream), chunk_size):
+                framer.feed(stream[i : i + chunk_size])
+                received.extend(framer)
+            self.assertEqual(
+                [self.protocol.deserialize_message(m).content for m in received],
+                [f"Framed message {i}" for i in range(3)],
+            )
+            self.assertEqual(framer.pending(), b"")
+
+        # A partial frame stays pending until the rest arrives
+        framer = self.protocol.framer()
+        framer.feed(frames[0][:-1])
+        self.assertIsNone(framer.next_message())
+        self.assertEqual(framer.pending(), frames[0][:-1])
+        framer.feed(frames[0][-1:] + frames[1])
+        self.assertEqual(
+            [self.protocol.deserialize_message(m).content for m in framer],
+            ["Framed message 0", "Framed message 1"],
+        )
+
+    def test_to_wire(self):
+        """Test to_wire matches serialize_message followed by frame_message"""
+        msg = ChatMessage(
+            username="user1",
+            content="Framed in one step",
+            message_type=MessageType.CHAT,
+            timestamp=datetime.now(),
+        )
+
+        wire = self.protocol.to_wire(msg)
+        self.assertEqual(
+            wire, self.protocol.frame_message(self.protocol.serialize_message(msg))
+        )
+
+        extracted, remaining = self.protocol.extract_message(wire)
+        self.assertEqual(
+            self.protocol.deserialize_message(extracted).content, msg.content
+        )
+        self.assertEqual(len(remaining), 0)
+
+    def test_frame_parts(self):
+        """Test frame_parts joins to the same bytes as frame_message"""
+        data = self.protocol.serialize_message(
+            ChatMessage(
+                username="user1",
+                content="Sent in parts",
+                message_type=MessageType.CHAT,
+                timestamp=datetime.now(),
+            )
+        )
+
+        parts = self.protocol.frame_parts(data)
+        self.assertIsInstance(parts, tuple)
+        self.assertEqual(b"".join(parts), self.protocol.frame_message(data))
+
     def test_login_message(self):
         """Test login message with password"""
         original_msg = ChatMessage(
@@ -196,6 +338,59 @@ class TestCustomWireProtocol(unittest.TestCase, BaseProtocolTest):
     def setUp(self):
         self.protocol = CustomWireProtocol()
 
+    def test_framer_decodes_header_once(self):
+        """Test the framer waits for the full frame once its header is known"""
+        frame = self.protocol.to_wire(
+            ChatMessage(
+                username="user1",
+                content="x" * 100,
+                message_type=MessageType.CHAT,
+                timestamp=datetime.now(),
+            )
+        )
+        framer = self.protocol.framer()
+        framer.feed(frame[:10])
+        self.assertIsNone(framer.next_message())
+        self.assertEqual(framer.need, len(frame))
+
+        with patch.object(
+            self.protocol,
+            "extract_message_from",
+            wraps=self.protocol.extract_message_from,
+        ) as extract:
+            for i in range(10, len(frame) - 1):
+                framer.feed(frame[i : i + 1])
+                self.assertIsNone(framer.next_message())
+            extract.assert_not_called()
+            framer.feed(frame[-1:])
+            self.assertEqual(framer.next_message(), frame)
+            extract.assert_called_once()
+
+
+@unittest.skipIf(orjson is None, "orjson is not installed")
+class TestORJSONProtocol(unittest.TestCase, BaseProtocolTest):
+    def setUp(self):
+        self.protocol = ORJSONProtocol()
+
+    def test_wire_compatible_with_json(self):
+        """Test orjson output is byte-identical to the plain JSON protocol"""
+        response = ServerResponse(
+            status=Status.SUCCESS,
+            message="Operation successful",
+            data=ChatMessage(
+                username="sender",
+                content='Quotes " and unicode \u00e9',
+                message_type=MessageType.DM,
+                recipients=["recipient"],
+                timestamp=datetime.now(),
+            ),
+        )
+
+        self.assertEqual(
+            self.protocol.serialize_response(response),
+            JSONProtocol().serialize_response(response),
+        )
+
 
 class TestProtocolEquivalence(unittest.TestCase):
     """Test that both protocols produce equivalent results"""
@@ -284,6 +479,11 @@ class StressTest(unittest.TestCase):
             with self.assertRaises(Exception):
                 protocol.serialize_message(msg)
 
+            # The limit counts encoded bytes, not characters
+            msg.content = "\u00e9" * 500_001  # 1_000_002 bytes in UTF-8
+            with self.assertRaises(ValueError):
+                protocol.serialize_message(msg)
+
     def test_unicode_handling(self):
         """Test handling of various Unicode characters"""
         test_strings = [